@@ -1,6 +1,7 @@
 import numpy as np
 import functions_DOS as fD
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
 
 
 """defining lattice parameters"""
@@ -16,16 +17,18 @@ interval_energy = 5  # interval over which the energy is computed, measured in b
 
 """defining integration parameters"""
 num_points_xi = 1000  # number of points over which the integral is computed
-energy_border_parameter = 3  # number of points added to the integral tails, measured in num_points_xi
 
 """file name where the DOS is stored, keep it empty to not save it"""
 file_name = ""
 
-"""computing the DOS"""
+"""computing the DOS, the different values of beta are independent and computed in parallel"""
+results = Parallel(n_jobs=-1)(
+    delayed(fD.gross_dos)(energy_0, val, lattice_constant, points_energy_div_2,
+                          num_points_xi, interval_energy, progress=False, use_aot=True)
+    for val in beta
+)
 E, DOS = [], []
-for idx, val in enumerate(beta):
-    E_buff, DOS_buff = fD.gross_dos(energy_0, val, lattice_constant, points_energy_div_2,
-                                    num_points_xi, interval_energy, energy_border_parameter)
+for E_buff, DOS_buff in results:
     E.append(E_buff)
     DOS.append(DOS_buff)
 
@@ -49,9 +52,10 @@ plt.legend()
 
 """extracting the values at the band edges"""
 band_edge_values = np.zeros_like(beta)
-for idx, val in enumerate(beta):
-    index = next((i for i, x in enumerate(DOS[idx]) if x > 0 and not np.isnan(x)), None)
-    band_edge_values[idx] = np.average(DOS[idx][int(index)])
+for idx, dos in enumerate(DOS):
+    "first value of the DOS which is positive and not nan"
+    mask = (dos > 0) & ~np.isnan(dos)
+    band_edge_values[idx] = dos[mask.argmax() if mask.any() else 0]
 
 """plotting the DOS edge value as function of beta"""
 fig, axs = plt.subplots(1)
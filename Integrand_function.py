@@ -8,8 +8,7 @@ energy_0 = 0  # atomic energy level
 beta = 5  # hopping energy
 
 """defining parameters of the integrand function"""
-num_points_xi = 40  # number of points of the integral function in the "overall" region
-energy_border_parameter = 3  # number of points added to the integral tails, measured in num_points_xi
+num_points_xi = 40  # number of points of the integral function, denser at the borders
 
 """defining energy vector that will be used for plotting different curves"""
 energy = np.linspace(-5, 5, 11)
@@ -17,7 +16,7 @@ energy = np.linspace(-5, 5, 11)
 """plotting the integrand function for the different values of energy"""
 fig, axs = plt.subplots(1)
 for E in energy:
-    k, f = fD.integrand_function(E, energy_0, beta, num_points_xi, energy_border_parameter)
+    k, f = fD.integrand_function(E, energy_0, beta, num_points_xi)
     axs.semilogy(k, f, ".", label="Energy = {}".format(E))
 axs.set_xlabel(r"$\xi$")
 axs.set_ylabel("Integrand function")
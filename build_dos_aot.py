@@ -0,0 +1,63 @@
+import os
+import zlib
+import numpy as np
+from numba.pycc import CC
+import functions_DOS as fD
+
+
+"""defining the ahead-of-time compiled module, built next to this script"""
+cc = CC('dos_aot')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+"""crc32 of functions_DOS.py, used by it to detect a module built from a different version"""
+with open(fD.__file__, "rb") as source_file:
+    SOURCE_CRC = zlib.crc32(source_file.read())
+
+
+@cc.export('source_crc', 'i8()')
+def source_crc() -> int:
+    return SOURCE_CRC
+
+
+@cc.export('gross_dos_core', 'f8[:](f8[:], f8, f8, f8[:], f8[:], f8[:], f8[:])')
+def gross_dos_core(
+        energy_array: np.ndarray,
+        energy_0: float,
+        beta: float,
+        lower_array: np.ndarray,
+        upper_array: np.ndarray,
+        cos_theta: np.ndarray,
+        sin_theta: np.ndarray
+) -> np.ndarray:
+
+    """
+    Parameters
+    ----------
+    energy_array (np.ndarray): array containing the energy values
+    energy_0 (float): energy of isolated atom
+    beta (float): hopping energy
+    lower_array (np.ndarray): lower limits for the DOS integral, one for each energy value
+    upper_array (np.ndarray): upper limits for the DOS integral, one for each energy value
+    cos_theta (np.ndarray): cosine of the theta midpoints in [0, pi], see fD._theta_array
+    sin_theta (np.ndarray): sine of the same theta values
+
+    Returns
+    -------
+    integral_array (np.ndarray): array containing the integral for each value of energy
+
+    Notes
+    -----
+    This function is the ahead-of-time compiled version of fD._gross_dos_core: importing it costs
+    no compilation, which pays off when many short processes are started, e.g. by joblib.
+    Ahead-of-time compilation does not support parallel=True, so the energy values are computed serially.
+    """
+
+    integral_array = np.empty_like(energy_array)
+    for idx in range(energy_array.size):
+        integral_array[idx] = fD.dos_at_energy(energy_array[idx], energy_0, beta, lower_array[idx], upper_array[idx],
+                                               cos_theta, sin_theta)
+    return integral_array
+
+
+"""compiling the module"""
+cc.compile()
@@ -1,8 +1,28 @@
+import math
+import warnings
+import zlib
 import numpy as np
-from scipy import integrate
+from numba import cfunc, njit, prange, types
+from scipy import LowLevelCallable, integrate
 from tqdm import tqdm
 
+"ahead-of-time compiled energy sweep, available after running build_dos_aot.py; it is used only"
+"if it was built from the current version of this file, compared through the crc32 of the source"
+_gross_dos_core_aot = None
+try:
+    import dos_aot
+except ImportError:
+    dos_aot = None
+if dos_aot is not None and hasattr(dos_aot, "source_crc"):
+    with open(__file__, "rb") as source_file:
+        if dos_aot.source_crc() == zlib.crc32(source_file.read()):
+            _gross_dos_core_aot = dos_aot.gross_dos_core
 
+"number of energy values computed between two updates of the gross_dos progress bar"
+PROGRESS_BLOCK = 100
+
+
+@njit(cache=True)
 def integral_lower_limit(
         energy: float,
         energy_0: float,
@@ -31,6 +51,7 @@ def integral_lower_limit(
         return np.arccos((energy_0 - energy) / (2 * beta) + 1)
 
 
+@njit(cache=True)
 def integral_upper_limit(
         energy: float,
         energy_0: float,
@@ -59,12 +80,174 @@ def integral_upper_limit(
         return np.arccos((energy_0 - energy) / (2 * beta) - 1)
 
 
+def integral_limits(
+        energy_array: np.ndarray,
+        energy_0: float,
+        beta: float
+) -> (np.ndarray, np.ndarray):
+
+    """
+    Parameters
+    ----------
+    energy_array (np.ndarray): array containing the energy values
+    energy_0 (float): energy of isolated atom
+    beta (float): hopping energy
+
+    Returns
+    -------
+    lower_array (np.ndarray): lower limits for the DOS integral
+    upper_array (np.ndarray): upper limits for the DOS integral
+
+    Notes
+    -----
+    This function is the vectorized version of integral_lower_limit and integral_upper_limit
+    for a whole energy array; the arguments of arccos are clipped to [-1, 1] so that the
+    not valid energies do not produce nan values before being replaced by 0 and pi.
+    """
+
+    argument = (energy_0 - energy_array) / (2 * beta)
+    lower_array = np.where((energy_0 <= energy_array) & (energy_array <= energy_0 + 4 * beta),
+                           np.arccos(np.clip(argument + 1, -1, 1)), 0.0)
+    upper_array = np.where((energy_0 - 4 * beta <= energy_array) & (energy_array <= energy_0),
+                           np.arccos(np.clip(argument - 1, -1, 1)), np.pi)
+    return lower_array, upper_array
+
+
+@njit(cache=True)
+def _xi_value(
+        lower_limit: float,
+        upper_limit: float,
+        cos_theta: float
+) -> float:
+
+    """
+    Parameters
+    ----------
+    lower_limit (float): lower limit for the DOS integral
+    upper_limit (float): upper limit for the DOS integral
+    cos_theta (float): cosine of theta, with theta in [0, pi]
+
+    Returns
+    -------
+    (float) xi = lower + (upper - lower) * (1 - cos(theta)) / 2
+
+    Notes
+    -----
+    With this substitution the integrand over theta, y * (upper - lower) * sin(theta) / 2, stays bounded:
+    at a border where y diverges as 1/sqrt the jacobian vanishes as sqrt, so the product tends to a finite,
+    non-zero limit. For theta equally spaced the xi values are naturally denser at the borders.
+    """
+
+    return lower_limit + (upper_limit - lower_limit) * (1 - cos_theta) / 2
+
+
+@njit(cache=True)
+def _integrand_value(
+        xi: float,
+        c: float
+) -> float:
+
+    """
+    Parameters
+    ----------
+    xi (float): current xi value
+    c (float): (energy_0 - energy) / (2 * beta) for the current energy
+
+    Returns
+    -------
+    (float) value of the integrand function
+
+    Notes
+    -----
+    Strictly inside the integration limits (c - cos(xi))^2 < 1, and the integrand diverges at a border
+    where it reaches 1. The theta midpoints, see _theta_array, and quad never evaluate the borders,
+    so the returned value is finite; 0 is only returned if a border is hit exactly or by rounding,
+    or outside the band.
+    """
+
+    differ = (c - math.cos(xi)) ** 2
+    return 1 / math.sqrt(1 - differ) if differ < 1 else 0.0
+
+
+@njit(cache=True)
+def _theta_array(
+        num_points: int
+) -> np.ndarray:
+
+    """
+    Parameters
+    ----------
+    num_points (int): number of points of the integration step
+
+    Returns
+    -------
+    theta_array (np.ndarray): midpoints (idx + 1/2) * pi / num_points of num_points equal intervals of [0, pi]
+
+    Notes
+    -----
+    The midpoint rule never evaluates the borders theta = 0 and pi, where the integrand over xi
+    may diverge, and it is second order in the step also when the integrand over theta,
+    y * (upper - lower) * sin(theta) / 2, tends to a finite non-zero limit at a singular border.
+    """
+
+    return (np.arange(num_points) + 0.5) * np.pi / num_points
+
+
+@njit(cache=True)
+def _fill_xi_array(
+        xi_array: np.ndarray,
+        lower_limit: float,
+        upper_limit: float
+):
+
+    """
+    Parameters
+    ----------
+    xi_array (np.ndarray): output array
+    lower_limit (float): lower limit for the DOS integral
+    upper_limit (float): upper limit for the DOS integral
+
+    Notes
+    -----
+    This function writes in place the xi values, see _xi_value, on the same theta midpoints
+    used by dos_at_energy, see _theta_array; the integration limits themselves are not included.
+    """
+
+    cos_theta = np.cos(_theta_array(xi_array.size))
+    for idx in range(xi_array.size):
+        xi_array[idx] = _xi_value(lower_limit, upper_limit, cos_theta[idx])
+
+
+@njit(cache=True, fastmath=True)
+def _integrand_kernel(
+        xi_array: np.ndarray,
+        c: float,
+        y_array: np.ndarray
+):
+
+    """
+    Parameters
+    ----------
+    xi_array (np.ndarray): array containing the xi values
+    c (float): (energy_0 - energy) / (2 * beta) for the current energy
+    y_array (np.ndarray): output array, of the same length of xi_array
+
+    Notes
+    -----
+    This function is compiled with numba and writes the integrand function over xi_array in y_array,
+    with the same values that dos_at_energy integrates.
+    """
+
+    for idx in range(xi_array.size):
+        y_array[idx] = _integrand_value(xi_array[idx], c)
+
+
+@njit(cache=True)
 def integrand_function(
         energy: float,
         energy_0: float,
         beta: float,
-        num_points: int,
-        bord_param: int = 0
+        num_points: int
 ) -> (np.ndarray, np.ndarray):
 
     """
@@ -74,7 +257,6 @@ def integrand_function(
     energy_0 (float): energy of isolated atom
     beta (float): hopping energy
     num_points (int): array length of the outputs
-    bord_param (int): defines the amount of points at the borders of xi-array
 
     Returns
     -------
@@ -84,7 +266,9 @@ def integrand_function(
     Notes
     -----
     This function returns two arrays, which correspond to the value of xi
-    and the corresponding ones of the integrand function (y).
+    and the corresponding ones of the integrand function (y). The xi values are taken on the
+    theta midpoints, see _theta_array, so the integration limits, where y may diverge, are excluded
+    and y is finite and positive inside the band; outside the band y is zero.
     """
 
     "defining the integration limits"
@@ -92,30 +276,189 @@ def integrand_function(
     upper_limit = integral_upper_limit(energy, energy_0, beta)
 
     "creating the output arrays"
-    xi_array = np.linspace(lower_limit, upper_limit, num_points)
-    step = upper_limit - lower_limit
-    # xi_array is denser at the border, where singularities occur, based on bord_param
-    for i in range(bord_param):
-        xi_array = np.concatenate((
-            np.linspace(lower_limit, lower_limit + step / num_points ** (i + 1), num_points),
-            xi_array[1:-1],
-            np.linspace(upper_limit - step / num_points ** (i + 1), upper_limit, num_points)
-        ))
+    xi_array = np.empty(num_points)
+    _fill_xi_array(xi_array, lower_limit, upper_limit)
     y_array = np.zeros_like(xi_array)
 
     "computing the y-values for appropriate values of energy"
     if np.abs((energy_0 - energy) / (4 * beta)) <= 1:
-        for idx, val in enumerate(xi_array):
-            differ = ((energy_0 - energy) / (2 * beta) - np.cos(val)) ** 2
-            "in order to avoid a divergence in the integrand function, the"
-            "next value would be equal to the previous one"
-            if differ < 1:
-                y_array[idx] = 1 / np.sqrt(1 - differ)
-            else:
-                y_array[idx] = y_array[idx - 1]
+        _integrand_kernel(xi_array, (energy_0 - energy) / (2 * beta), y_array)
     return xi_array, y_array
 
 
+@njit(cache=True)
+def trapz_weights(
+        x_array: np.ndarray,
+        y_array: np.ndarray
+) -> float:
+
+    """
+    Parameters
+    ----------
+    x_array (np.ndarray): array containing the x values, not necessarily equally spaced
+    y_array (np.ndarray): array containing the y values
+
+    Returns
+    -------
+    (float) integral of y over x
+
+    Notes
+    -----
+    This function computes the trapezoidal integral as a single dot product between y_array and
+    the weight vector w, where w[i] = x[i+1] - x[i-1] and the endpoints only take half of it.
+    """
+
+    weights = np.empty_like(x_array)
+    weights[0] = x_array[1] - x_array[0]
+    weights[-1] = x_array[-1] - x_array[-2]
+    weights[1:-1] = x_array[2:] - x_array[:-2]
+    return 0.5 * np.dot(weights, y_array)
+
+
+@njit(cache=True, fastmath=True)
+def dos_at_energy(
+        energy: float,
+        energy_0: float,
+        beta: float,
+        lower_limit: float,
+        upper_limit: float,
+        cos_theta: np.ndarray,
+        sin_theta: np.ndarray
+) -> float:
+
+    """
+    Parameters
+    ----------
+    energy (float): current energy
+    energy_0 (float): energy of isolated atom
+    beta (float): hopping energy
+    lower_limit (float): lower limit for the DOS integral
+    upper_limit (float): upper limit for the DOS integral
+    cos_theta (np.ndarray): cosine of the theta midpoints in [0, pi], see _theta_array
+    sin_theta (np.ndarray): sine of the same theta values
+
+    Returns
+    -------
+    (float) integral of the integrand function for the specific value of energy
+
+    Notes
+    -----
+    This function integrates the integrand function without leaving compiled code. The integral is
+    computed over theta, see _xi_value, whose integrand function y * (upper - lower) * sin(theta) / 2
+    is bounded and is integrated with the midpoint rule, see _theta_array.
+    The xi and y values are computed one at a time and accumulated in the sum, so that
+    no array is ever built; cos_theta and sin_theta do not depend on the energy and are shared.
+    """
+
+    "outside the band the limits are the whole [0, pi] interval and the integrand is zero"
+    if np.abs((energy_0 - energy) / (4 * beta)) > 1:
+        return 0.0
+    c = (energy_0 - energy) / (2 * beta)
+    integral = 0.0
+    for idx in range(cos_theta.size):
+        integral += _integrand_value(_xi_value(lower_limit, upper_limit, cos_theta[idx]), c) * sin_theta[idx]
+    return integral * (upper_limit - lower_limit) / 2 * np.pi / cos_theta.size
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def _gross_dos_core(
+        energy_array: np.ndarray,
+        energy_0: float,
+        beta: float,
+        lower_array: np.ndarray,
+        upper_array: np.ndarray,
+        cos_theta: np.ndarray,
+        sin_theta: np.ndarray
+) -> np.ndarray:
+
+    """
+    Parameters
+    ----------
+    energy_array (np.ndarray): array containing the energy values
+    energy_0 (float): energy of isolated atom
+    beta (float): hopping energy
+    lower_array (np.ndarray): lower limits for the DOS integral, one for each energy value
+    upper_array (np.ndarray): upper limits for the DOS integral, one for each energy value
+    cos_theta (np.ndarray): cosine of the theta midpoints in [0, pi], see _theta_array
+    sin_theta (np.ndarray): sine of the same theta values
+
+    Returns
+    -------
+    integral_array (np.ndarray): array containing the integral for each value of energy
+
+    Notes
+    -----
+    This function loops over the energy values in compiled code, avoiding to re-enter python
+    for each of them. The energy values are independent, so they are distributed over all the cores.
+    """
+
+    integral_array = np.empty_like(energy_array)
+    for idx in prange(energy_array.size):
+        integral_array[idx] = dos_at_energy(energy_array[idx], energy_0, beta, lower_array[idx], upper_array[idx],
+                                            cos_theta, sin_theta)
+    return integral_array
+
+
+@cfunc(types.float64(types.intc, types.CPointer(types.float64)), cache=True)
+def _integrand_callback(
+        num_args: int,
+        args: types.CPointer
+) -> float:
+
+    """
+    Parameters
+    ----------
+    num_args (int): number of values in args
+    args (types.CPointer): pointer to xi and (energy_0 - energy) / (2 * beta)
+
+    Returns
+    -------
+    (float) value of the integrand function
+
+    Notes
+    -----
+    This function is compiled as a C callback, so that scipy.integrate.quad can call it without
+    going through python. At the singular points, which quad never evaluates, it returns 0.
+    """
+
+    return _integrand_value(args[0], args[1])
+
+
+"the callback is wrapped once, so that quad receives it without any python work per energy value"
+_integrand_quad = LowLevelCallable(_integrand_callback.ctypes)
+
+
+def dos_at_energy_quad(
+        energy: float,
+        energy_0: float,
+        beta: float
+) -> float:
+
+    """
+    Parameters
+    ----------
+    energy (float): current energy
+    energy_0 (float): energy of isolated atom
+    beta (float): hopping energy
+
+    Returns
+    -------
+    (float) integral of the integrand function for the specific value of energy
+
+    Notes
+    -----
+    This function integrates the integrand function with the adaptive scipy.integrate.quad, which
+    deals with the integrable singularities at the borders without any grid of xi values.
+    """
+
+    "outside the band the limits are the whole [0, pi] interval and the integrand is zero"
+    if abs((energy_0 - energy) / (4 * beta)) > 1:
+        return 0.0
+    lower_limit = integral_lower_limit(energy, energy_0, beta)
+    upper_limit = integral_upper_limit(energy, energy_0, beta)
+    return integrate.quad(_integrand_quad, lower_limit, upper_limit, args=((energy_0 - energy) / (2 * beta),))[0]
+
+
 def gross_dos(
         energy_0: float,
         beta: float,
@@ -123,7 +466,10 @@ def gross_dos(
         num_points_energy: int,
         num_points_xi: int,
         interval_energy: float = 4.2,
-        bord_param: int = 0
+        *,
+        use_quad: bool = False,
+        progress: bool = True,
+        use_aot: bool = False
 ) -> (np.ndarray, np.ndarray):
 
     """
@@ -135,7 +481,10 @@ def gross_dos(
     num_points_energy (int): array length of the outputs (energy and DOS)
     num_points_xi (int): array length of the xi-array for the integration step
     interval_energy (float): interval of energy respect to E0 measured in beta, suggested value is slightly above 4
-    bord_param (int): defines the amount of points at the borders of xi-array
+    use_quad (bool): integrate with the adaptive scipy.integrate.quad, num_points_xi is ignored
+    progress (bool): show the progress bar, it can be disabled when many DOS are computed in parallel
+    use_aot (bool): use the serial ahead-of-time compiled sweep built by build_dos_aot.py instead of the
+        parallel jit one; it avoids the compilation in every new process, e.g. with joblib
 
     Returns
     -------
@@ -157,13 +506,32 @@ def gross_dos(
         np.linspace(energy_0, energy_0 + step / num_points, num_points)[1:],
         np.linspace(energy_0, energy_0 + step, num_points)[1:]
     ))
-    dos_array = np.zeros_like(energy_array)
 
-    "tqdm allows to have the progress bar"
-    for idx in tqdm(range(len(energy_array))):
-        energy_val = energy_array[idx]
-        x_data, y_data = integrand_function(energy_val, energy_0, beta, num_points_xi, bord_param)
-        dos_array[idx] = 1 / (lattice_constant ** 2 * beta * np.pi ** 2) * integrate.simps(y_data, x_data)
+    "tqdm allows to have the progress bar, refreshed at most every 0.5 s"
+    integral_array = np.zeros_like(energy_array)
+    if use_quad:
+        for idx in tqdm(range(len(energy_array)), mininterval=0.5, disable=not progress):
+            integral_array[idx] = dos_at_energy_quad(energy_array[idx], energy_0, beta)
+    else:
+        "the integration limits and the theta values are computed at once for all the energy values"
+        lower_array, upper_array = integral_limits(energy_array, energy_0, beta)
+        theta_array = _theta_array(num_points_xi)
+        cos_theta, sin_theta = np.cos(theta_array), np.sin(theta_array)
+        gross_dos_core = _gross_dos_core
+        if use_aot:
+            if _gross_dos_core_aot is None:
+                warnings.warn("dos_aot is missing or was built from a different functions_DOS.py, "
+                              "run build_dos_aot.py again; the jit sweep is used")
+            else:
+                gross_dos_core = _gross_dos_core_aot
+        "the energy sweep is performed in compiled code; it is split in blocks of PROGRESS_BLOCK values"
+        "only to update the progress bar, so without it a single block is used"
+        block = PROGRESS_BLOCK if progress else len(energy_array)
+        for start in tqdm(range(0, len(energy_array), block), mininterval=0.5, disable=not progress):
+            integral_array[start:start + block] = gross_dos_core(
+                energy_array[start:start + block], float(energy_0), float(beta),
+                lower_array[start:start + block], upper_array[start:start + block], cos_theta, sin_theta)
+    dos_array = 1 / (lattice_constant ** 2 * beta * np.pi ** 2) * integral_array
 
     return energy_array, dos_array
 
@@ -190,9 +558,9 @@ def low_dos(
     and the corresponding ones of the density of states with the values below the average.
     """
 
-    dos_low = dos[[n for n, i in enumerate(dos) if i < np.average(dos)]]
-    energy_low = energy[[n for n, i in enumerate(dos) if i < np.average(dos)]]
-    return energy_low, dos_low
+    "nan values of the dos are excluded from the average"
+    mask = dos < np.nanmean(dos)
+    return energy[mask], dos[mask]
 
 
 def high_dos(
@@ -217,6 +585,6 @@ def high_dos(
     and the corresponding ones of the density of states with the values above the average.
     """
 
-    dos_high = dos[[n for n, i in enumerate(dos) if i > np.average(dos)]]
-    energy_high = energy[[n for n, i in enumerate(dos) if i > np.average(dos)]]
-    return energy_high, dos_high
+    "nan values of the dos are excluded from the average"
+    mask = dos > np.nanmean(dos)
+    return energy[mask], dos[mask]
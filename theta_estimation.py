@@ -1,7 +1,7 @@
 import numpy as np
 import functions_DOS as fD
 import matplotlib.pyplot as plt
-from scipy import integrate
+from joblib import Parallel, delayed
 
 
 """defining lattice parameters"""
@@ -14,24 +14,30 @@ points_energy_div_2 = 500  # number of half the energy points
 interval_energy = 4  # interval over which the energy is computed, measured in beta
 
 """defining integration parameters"""
-num_points_xi = 500  # number of points over which the integral is computed
-energy_border_parameter = np.linspace(0, 4, 5, dtype=int)  # points added to integral tails, measured in num_points_xi
-
-"""computing the DOSs with varying border parameter, the DOS are 'cleaned'"""
+num_points_xi = np.array([5, 10, 25, 50, 100])  # numbers of points over which the integral is computed
+"""with the midpoint rule over theta the goodness parameter stops depending on num_points_xi from about 50 points;
+the remaining distance from 1 is due to the energy discretisation around the singularity in energy_0,
+and it decreases by increasing points_energy_div_2"""
+
+"""computing the DOSs with varying number of integration points in parallel, the DOS are 'cleaned'"""
+results = Parallel(n_jobs=-1)(
+    delayed(fD.gross_dos)(energy_0, beta, lattice_constant, points_energy_div_2,
+                          num_points, interval_energy, progress=False, use_aot=True)
+    for num_points in num_points_xi
+)
 E = []
 DOS = []
-for bor_par in energy_border_parameter:
-    E_buff, DOS_buff = fD.gross_dos(energy_0, beta, lattice_constant, points_energy_div_2,
-                                    num_points_xi, interval_energy, bor_par)
-    E_buff, DOS_buff = E_buff[~np.isnan(DOS_buff)], DOS_buff[~np.isnan(DOS_buff)]
+for E_buff, DOS_buff in results:
+    mask = ~np.isnan(DOS_buff)
+    E_buff, DOS_buff = E_buff[mask], DOS_buff[mask]
     E.append(E_buff)
     DOS.append(DOS_buff)
 
-"""computing the goodness parameters"""
+"""computing the goodness parameters, the stored arrays are already free of nan values"""
 goodness_parameters = []
 for i in range(len(E)):
     const = lattice_constant**2/2
-    goodness_parameters.append(const*integrate.trapz(DOS[i][~np.isnan(DOS[i])], E[i][~np.isnan(DOS[i])]))
+    goodness_parameters.append(const*fD.trapz_weights(E[i], DOS[i]))
 
 """plotting the DOS"""
 fig, axs = plt.subplots(1)